@@ -1,317 +1,475 @@
-import base64
-import re
-import time
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-
-import requests
-import pandas as pd
-from tqdm import tqdm
-
-
-# ====== 你要改的設定 ======
-API_USER = "opdUser921"
-API_PASS = "VHa5hsmN9x"
-
-INPUT_FILE = "patents.xlsx"   # 也可用 patents.csv
-INPUT_COLUMN = "公開公告號"
-
-SAVE_DIR = Path("pdf_downloads")
-SAVE_DIR.mkdir(exist_ok=True)
-
-# 若你只想下載「公報」可以在這裡設關鍵字（保留 None 表示全抓）
-# 例：只抓含「公報」的檔名：["公報"]
-# 例：只抓 PDF：[".pdf"]
-FILENAME_INCLUDE_KEYWORDS: Optional[List[str]] = None
-
-# 速度與穩定性
-SLEEP_BETWEEN_CASES = 0.25
-RETRY = 3
-TIMEOUT = 60
-
-
-# ====== 官方 API endpoints ======
-AUTH_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getAuth"
-CASEINFO_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getCaseInfo/{}"
-FILELIST_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getResultFileList/{}"
-DOWNLOAD_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getfile/{}"
-
-
-def _basic_auth_header(user: str, pwd: str) -> str:
-    raw = f"{user}:{pwd}".encode("utf-8")
-    return base64.b64encode(raw).decode("ascii")
-
-
-def get_token(session: requests.Session) -> str:
-    basic = _basic_auth_header(API_USER, API_PASS)
-    r = session.get(
-        AUTH_URL,
-        headers={"Authorization": f"Basic {basic}"},
-        timeout=TIMEOUT,
-    )
-    r.raise_for_status()
-
-    # 正常情況會回傳 JSON，但有時候可能回傳非 JSON（例如純文字或 HTML），
-    # 所以先嘗試解析 JSON，失敗時再用一些簡單的正則去抓 token。
-    try:
-        data = r.json()
-    except requests.exceptions.JSONDecodeError:
-        text = r.text or ""
-        # 常見的 token 樣式：{"token":"..."} 或 {"access_token":"..."}，或 token=... 等
-        m = re.search(r'"(?:access_)?token"\s*:\s*"([^"]+)"', text)
-        if m:
-            return m.group(1)
-        m = re.search(r"token=([^&\s]+)", text)
-        if m:
-            return m.group(1)
-        # 如果回傳是單純的字串（例如直接回傳 token），就回傳整個 trimmed 文本
-        if text.strip():
-            return text.strip()
-        raise RuntimeError(f"getAuth 回傳無法解析的內容（非 JSON），前 300 字：{text[:300]!r}")
-
-    token = None
-    if isinstance(data, dict):
-        token = data.get("token") or data.get("access_token") or data.get("data")
-    elif isinstance(data, str) and data.strip():
-        token = data.strip()
-
-    if not token:
-        raise RuntimeError(f"getAuth 回傳找不到 token：{data}")
-    return token
-
-
-def normalize_case_id(pubno: str) -> str:
-    """
-    常見格式：TW202528785A -> 202528785
-    若不符合就原樣回傳（讓 API 自己判斷）
-    """
-    s = (pubno or "").strip()
-    m = re.fullmatch(r"TW(\d+)[A-Z]\d*", s, flags=re.IGNORECASE)
-    if m:
-        return m.group(1)
-    return s
-
-
-def safe_filename(name: str) -> str:
-    # Windows 不允許的字元替換掉
-    return re.sub(r'[<>:"/\\|?*\n\r\t]', "_", name).strip()
-
-
-def keyword_filter(filename: str) -> bool:
-    if FILENAME_INCLUDE_KEYWORDS is None:
-        return True
-    f = filename.lower()
-    return any(k.lower() in f for k in FILENAME_INCLUDE_KEYWORDS)
-
-
-def request_json_with_retry(
-    session: requests.Session,
-    method: str,
-    url: str,
-    headers: Dict[str, str],
-) -> Dict[str, Any]:
-    last_err = None
-    for attempt in range(1, RETRY + 1):
-        try:
-            r = session.request(method, url, headers=headers, timeout=TIMEOUT)
-            r.raise_for_status()
-            return r.json()
-        except Exception as e:
-            last_err = e
-            time.sleep(0.6 * attempt)
-    raise RuntimeError(f"請求失敗：{url}，最後錯誤：{last_err}")
-
-
-def get_case_info(session: requests.Session, token: str, case_id: str) -> Dict[str, Any]:
-    return request_json_with_retry(
-        session,
-        "GET",
-        CASEINFO_URL.format(case_id),
-        headers={"Authorization": f"Bearer {token}"},
-    )
-
-
-def get_file_list(session: requests.Session, token: str, case_no: str) -> Any:
-    # 這支回傳可能是 list 或 dict（看系統版本），先用 Any 接住
-    url = FILELIST_URL.format(case_no)
-    last_err = None
-    for attempt in range(1, RETRY + 1):
-        try:
-            r = session.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=TIMEOUT)
-            r.raise_for_status()
-            return r.json()
-        except Exception as e:
-            last_err = e
-            time.sleep(0.6 * attempt)
-    raise RuntimeError(f"getResultFileList 失敗：{url}，最後錯誤：{last_err}")
-
-
-def parse_file_items(file_list_json: Any) -> List[Tuple[str, str]]:
-    """
-    回傳 [(fileName, fileId或fileURL), ...]
-
-    支援的格式包括：
-    - list[dict]
-    - dict 裡面包 list (data/files)
-    - 特別處理 TIPO 新版回傳的 {"resultFileList": [...]} 內含 "fileList" 的結構
-    """
-    items: List[Tuple[str, str]] = []
-
-    def _add(fname: Optional[str], fid: Optional[str]) -> None:
-        if not fname or not fid:
-            return
-        items.append((str(fname), str(fid)))
-
-    # 新版 API 回傳格式：{"resultFileList": [{..., "fileList":[{ "showName":..., "fileURL":...}, ...]}, ...]}
-    if isinstance(file_list_json, dict) and file_list_json.get("resultFileList"):
-        for entry in file_list_json.get("resultFileList", []) or []:
-            if not isinstance(entry, dict):
-                continue
-            for f in entry.get("fileList", []) or []:
-                if not isinstance(f, dict):
-                    continue
-                fname = f.get("showName") or f.get("fileName") or f.get("name")
-                fid = f.get("fileURL") or f.get("fileId") or f.get("id")
-                # 如果 fid 是完整的 URL，嘗試從其中擷取 /getfile/<id>
-                if isinstance(fid, str) and fid.startswith("http"):
-                    m = re.search(r"/getfile/([A-Za-z0-9]+)", fid)
-                    if m:
-                        fid = m.group(1)
-                _add(fname, fid)
-        return items
-
-    # 回退到原先的通用處理
-    if isinstance(file_list_json, list):
-        candidates = file_list_json
-    elif isinstance(file_list_json, dict):
-        candidates = file_list_json.get("data") or file_list_json.get("files") or []
-    else:
-        candidates = []
-
-    for x in candidates:
-        if not isinstance(x, dict):
-            continue
-        fname = x.get("fileName") or x.get("filename") or x.get("name") or x.get("showName")
-        fid = x.get("fileId") or x.get("fileID") or x.get("id") or x.get("fileURL")
-        if isinstance(fid, str) and fid.startswith("http"):
-            m = re.search(r"/getfile/([A-Za-z0-9]+)", fid)
-            if m:
-                fid = m.group(1)
-        if fname and fid:
-            items.append((str(fname), str(fid)))
-    return items
-
-
-def download_file(session: requests.Session, token: str, file_id: str, save_path: Path) -> None:
-    # file_id 可能是純 id（例如 0900238e...）或是完整的 fileURL
-    if isinstance(file_id, str) and file_id.startswith("http"):
-        url = file_id
-    else:
-        url = DOWNLOAD_URL.format(file_id)
-
-    last_err = None
-    for attempt in range(1, RETRY + 1):
-        try:
-            with session.get(
-                url,
-                headers={"Authorization": f"Bearer {token}"},
-                stream=True,
-                timeout=TIMEOUT,
-            ) as r:
-                r.raise_for_status()
-                with open(save_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024 * 128):
-                        if chunk:
-                            f.write(chunk)
-            return
-        except Exception as e:
-            last_err = e
-            time.sleep(0.8 * attempt)
-    raise RuntimeError(f"下載失敗：{url} -> {save_path.name}，最後錯誤：{last_err}")
-
-
-def read_input_file(path: str) -> pd.DataFrame:
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"找不到輸入檔：{path}")
-
-    if p.suffix.lower() in [".xlsx", ".xls"]:
-        return pd.read_excel(p)
-    elif p.suffix.lower() == ".csv":
-        return pd.read_csv(p)
-    else:
-        raise ValueError("輸入檔只支援 .xlsx/.xls/.csv")
-
-
-def main():
-    df = read_input_file(INPUT_FILE)
-
-    if INPUT_COLUMN not in df.columns:
-        raise ValueError(f"輸入檔沒有欄位：{INPUT_COLUMN}，目前欄位：{list(df.columns)}")
-
-    pubnos = df[INPUT_COLUMN].dropna().astype(str).tolist()
-
-    session = requests.Session()
-    token = get_token(session)
-
-    log_rows = []
-
-    for pubno in tqdm(pubnos, desc="Downloading"):
-        case_id = normalize_case_id(pubno)
-
-        try:
-            case_info = get_case_info(session, token, case_id)
-
-            # token 過期時，有些系統會回特定 code/msg，你也可以在這裡加判斷後自動 refresh token
-            case_no = case_info.get("caseNo") or case_info.get("caseNO")
-
-            if not case_no:
-                log_rows.append({"公開公告號": pubno, "caseId": case_id, "status": "FAIL", "reason": "查不到 caseNo"})
-                continue
-
-            file_list_json = get_file_list(session, token, str(case_no))
-            file_items = parse_file_items(file_list_json)
-
-            if not file_items:
-                log_rows.append({"公開公告號": pubno, "caseId": case_id, "caseNo": case_no, "status": "FAIL", "reason": "沒有可下載檔案"})
-                continue
-
-            downloaded = 0
-            for fname, fid in file_items:
-                if not keyword_filter(fname):
-                    continue
-
-                out_name = safe_filename(f"{pubno}_{fname}")
-                save_path = SAVE_DIR / out_name
-
-                # 已存在就略過（可重跑）
-                if save_path.exists() and save_path.stat().st_size > 0:
-                    downloaded += 1
-                    continue
-
-                download_file(session, token, fid, save_path)
-                downloaded += 1
-
-            log_rows.append({"公開公告號": pubno, "caseId": case_id, "caseNo": case_no, "status": "OK", "downloaded_files": downloaded})
-
-            time.sleep(SLEEP_BETWEEN_CASES)
-
-        except Exception as e:
-            log_rows.append({"公開公告號": pubno, "caseId": case_id, "status": "FAIL", "reason": str(e)})
-
-    # 輸出 log
-    log_df = pd.DataFrame(log_rows)
-    log_path = Path("download_log.csv")
-    try:
-        log_df.to_csv(log_path, index=False, encoding="utf-8-sig")
-        print(f"完成！下載資料夾：pdf_downloads/，log：{log_path}")
-    except PermissionError:
-        # 如果檔案被其它程式開啟（例如 Excel），則改寫入含時間戳的新檔名
-        import datetime
-        alt = Path(f"download_log_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-        log_df.to_csv(alt, index=False, encoding="utf-8-sig")
-        print(f"原始 log 檔案無法寫入（被其他程式鎖定），已改寫入：{alt}")
-
-
-if __name__ == "__main__":
-    main()
+import base64
+import csv
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from openpyxl import load_workbook
+from tqdm import tqdm
+
+
+# ====== 你要改的設定 ======
+API_USER = "opdUser921"
+API_PASS = "VHa5hsmN9x"
+
+# 帳密是常數，Basic 認證標頭在 import 時編好一次即可
+_BASIC_AUTH = "Basic " + base64.b64encode(f"{API_USER}:{API_PASS}".encode("utf-8")).decode("ascii")
+
+INPUT_FILE = "patents.xlsx"   # 也可用 patents.csv（.xls 請先另存成 .xlsx）
+INPUT_COLUMN = "公開公告號"
+
+SAVE_DIR = Path("pdf_downloads")
+SAVE_DIR.mkdir(exist_ok=True)
+
+# 若你只想下載「公報」可以在這裡設關鍵字（保留 None 表示全抓）
+# 例：只抓含「公報」的檔名：["公報"]
+# 例：只抓 PDF：[".pdf"]
+FILENAME_INCLUDE_KEYWORDS: Optional[List[str]] = None
+
+# 速度與穩定性
+MAX_WORKERS = 16          # 同時處理幾筆案件（純網路 I/O；與下載 pool 合計剛好吃滿 32 條連線池）
+RETRY = 3
+TIMEOUT = 60
+TOKEN_REFRESH_MARGIN = 30  # token 到期前幾秒就先主動換新
+
+
+# ====== 官方 API endpoints ======
+# 後三個是前綴，組 URL 直接字串相接即可（str.format 每次呼叫都要重新解析模板）
+AUTH_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getAuth"
+CASEINFO_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getCaseInfo/"
+FILELIST_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getResultFileList/"
+DOWNLOAD_URL = "https://tiponet.tipo.gov.tw/S092_API/opd1/getfile/"
+
+
+# ====== 熱路徑用的 regex，import 時編譯一次 ======
+_UNSAFE_FN = re.compile(r'[<>:"/\\|?*\n\r\t]')
+_CASE_RE = re.compile(r"TW(\d+)[A-Z]\d*", re.IGNORECASE)
+_GETFILE_RE = re.compile(r"/getfile/([A-Za-z0-9]+)")
+_TOKEN_RE = re.compile(r'"(?:access_)?token"\s*:\s*"([^"]+)"')
+
+
+def _jwt_expiry(token: str) -> float:
+    """從 JWT payload 取出 exp；不是 JWT 或撈不到時假設 15 分鐘有效。"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)  # 補回被去掉的 base64 padding
+        return float(orjson.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + 900
+
+
+class TokenCache:
+    """管理 token 生命週期：到期前主動換新、401 時強制失效，多執行緒下只會有一個人去刷。"""
+
+    def __init__(self, session: requests.Session):
+        self._session = session
+        self._lock = threading.Lock()
+        self._expires_at = 0.0
+
+    def ensure_fresh(self) -> None:
+        if time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+            return
+        with self._lock:
+            if time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+                return  # 等鎖期間別人已經刷好了
+            token = get_token(self._session)
+            self._session.headers["Authorization"] = f"Bearer {token}"
+            self._expires_at = _jwt_expiry(token)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = 0.0
+
+
+class ApiSession(requests.Session):
+    """發請求前確保 token 還沒過期；收到 401 就換新 token 重送一次。"""
+
+    def __init__(self):
+        super().__init__()
+        self.token_cache = TokenCache(self)
+
+    def request(self, method, url, **kwargs):
+        # getAuth 本身走 Basic 認證，跳過 token 檢查（也避免 ensure_fresh 內再進來造成死鎖）
+        if url != AUTH_URL:
+            self.token_cache.ensure_fresh()
+        r = super().request(method, url, **kwargs)
+        if r.status_code == 401 and url != AUTH_URL:
+            self.token_cache.invalidate()
+            self.token_cache.ensure_fresh()
+            r = super().request(method, url, **kwargs)
+        return r
+
+
+def make_session() -> requests.Session:
+    """建立共用的 Session：加大連線池 + 明確 keep-alive，避免每次請求重新 TCP/TLS 握手。"""
+    session = ApiSession()
+    # 重試交給 urllib3：指數退避、只重試可安全重送的 GET 與暫時性的 5xx，並尊重 Retry-After
+    retry = Retry(
+        total=RETRY,
+        backoff_factor=0.6,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry))
+    session.headers["Connection"] = "keep-alive"
+    session.headers["User-Agent"] = "patent-downloader/1.0"
+    return session
+
+
+def _json(r: requests.Response) -> Any:
+    # orjson 解 JSON 比內建 json 快數倍，檔案清單動輒數百筆時有感
+    return orjson.loads(r.content)
+
+
+def get_token(session: requests.Session) -> str:
+    r = session.get(
+        AUTH_URL,
+        headers={"Authorization": _BASIC_AUTH},
+        timeout=TIMEOUT,
+    )
+    r.raise_for_status()
+
+    # 正常情況會回傳 JSON，但有時候可能回傳非 JSON（例如純文字或 HTML），
+    # 所以先嘗試解析 JSON，失敗時再用一些簡單的正則去抓 token。
+    try:
+        data = _json(r)
+    except orjson.JSONDecodeError:
+        text = r.text or ""
+        # 常見的 token 樣式：{"token":"..."} 或 {"access_token":"..."}，或 token=... 等
+        m = _TOKEN_RE.search(text)
+        if m:
+            return m.group(1)
+        m = re.search(r"token=([^&\s]+)", text)
+        if m:
+            return m.group(1)
+        # 如果回傳是單純的字串（例如直接回傳 token），就回傳整個 trimmed 文本
+        if text.strip():
+            return text.strip()
+        raise RuntimeError(f"getAuth 回傳無法解析的內容（非 JSON），前 300 字：{text[:300]!r}")
+
+    token = None
+    if isinstance(data, dict):
+        token = data.get("token") or data.get("access_token") or data.get("data")
+    elif isinstance(data, str) and data.strip():
+        token = data.strip()
+
+    if not token:
+        raise RuntimeError(f"getAuth 回傳找不到 token：{data}")
+    return token
+
+
+@lru_cache(maxsize=4096)
+def normalize_case_id(pubno: str) -> str:
+    """
+    常見格式：TW202528785A -> 202528785
+    若不符合就原樣回傳（讓 API 自己判斷）
+    """
+    s = (pubno or "").strip()
+    m = _CASE_RE.fullmatch(s)
+    if m:
+        return m.group(1)
+    return s
+
+
+@lru_cache(maxsize=4096)
+def safe_filename(name: str) -> str:
+    # Windows 不允許的字元替換掉
+    return _UNSAFE_FN.sub("_", name).strip()
+
+
+def keyword_filter(filename: str) -> bool:
+    if FILENAME_INCLUDE_KEYWORDS is None:
+        return True
+    f = filename.lower()
+    return any(k.lower() in f for k in FILENAME_INCLUDE_KEYWORDS)
+
+
+def request_json_with_retry(
+    session: requests.Session,
+    method: str,
+    url: str,
+) -> Dict[str, Any]:
+    # 重試（指數退避 + 5xx）已掛在 make_session 的 HTTPAdapter 上，這裡只處理最終失敗
+    # Authorization 已設定在 session.headers，不用每次重建
+    try:
+        r = session.request(method, url, timeout=TIMEOUT)
+        r.raise_for_status()
+        return _json(r)
+    except Exception as e:
+        raise RuntimeError(f"請求失敗：{url}，最後錯誤：{e}")
+
+
+def get_case_info(session: requests.Session, case_id: str) -> Dict[str, Any]:
+    return request_json_with_retry(session, "GET", CASEINFO_URL + case_id)
+
+
+def get_file_list(session: requests.Session, case_no: str) -> Any:
+    # 這支回傳可能是 list 或 dict（看系統版本），先用 Any 接住
+    url = FILELIST_URL + case_no
+    try:
+        r = session.get(url, timeout=TIMEOUT)
+        r.raise_for_status()
+        return _json(r)
+    except Exception as e:
+        raise RuntimeError(f"getResultFileList 失敗：{url}，最後錯誤：{e}")
+
+
+def _pick(d: Dict[str, Any], keys: Tuple[str, ...]) -> Optional[Any]:
+    # 依序回傳第一個非空欄位，取代一長串 .get(...) or .get(...) or ...
+    for k in keys:
+        v = d.get(k)
+        if v:
+            return v
+    return None
+
+
+def _norm_fid(fid: Any) -> Any:
+    # 如果 fid 是完整的 URL，嘗試從其中擷取 /getfile/<id>
+    if isinstance(fid, str) and fid.startswith("http"):
+        m = _GETFILE_RE.search(fid)
+        if m:
+            return m.group(1)
+    return fid
+
+
+def _parse_new(result_file_list: Any) -> List[Tuple[str, str]]:
+    # 新版 API 回傳格式：{"resultFileList": [{..., "fileList":[{ "showName":..., "fileURL":...}, ...]}, ...]}
+    items: List[Tuple[str, str]] = []
+    for entry in result_file_list or []:
+        if not isinstance(entry, dict):
+            continue
+        for f in entry.get("fileList") or []:
+            if not isinstance(f, dict):
+                continue
+            fname = _pick(f, ("showName", "fileName", "name"))
+            fid = _norm_fid(_pick(f, ("fileURL", "fileId", "id")))
+            if fname and fid:
+                items.append((str(fname), str(fid)))
+    return items
+
+
+def _parse_generic(candidates: Any) -> List[Tuple[str, str]]:
+    # 通用處理：list[dict]，欄位名稱看系統版本
+    items: List[Tuple[str, str]] = []
+    for x in candidates:
+        if not isinstance(x, dict):
+            continue
+        fname = _pick(x, ("fileName", "filename", "name", "showName"))
+        fid = _norm_fid(_pick(x, ("fileId", "fileID", "id", "fileURL")))
+        if fname and fid:
+            items.append((str(fname), str(fid)))
+    return items
+
+
+def parse_file_items(file_list_json: Any) -> List[Tuple[str, str]]:
+    """
+    回傳 [(fileName, fileId或fileURL), ...]
+
+    支援的格式包括：
+    - list[dict]
+    - dict 裡面包 list (data/files)
+    - 特別處理 TIPO 新版回傳的 {"resultFileList": [...]} 內含 "fileList" 的結構
+    """
+    if isinstance(file_list_json, dict):
+        rfl = file_list_json.get("resultFileList")
+        if rfl:
+            return _parse_new(rfl)
+        return _parse_generic(file_list_json.get("data") or file_list_json.get("files") or [])
+    if isinstance(file_list_json, list):
+        return _parse_generic(file_list_json)
+    return []
+
+
+def _file_url(file_id: str) -> str:
+    # file_id 可能是純 id（例如 0900238e...）或是完整的 fileURL
+    if isinstance(file_id, str) and file_id.startswith("http"):
+        return file_id
+    return DOWNLOAD_URL + file_id
+
+
+def is_already_downloaded(session: requests.Session, file_id: str, save_path: Path) -> bool:
+    """確認 save_path 已是完整檔案（用 HEAD 的 Content-Length 比對，避免舊版留下的半檔被誤判）。"""
+    if not save_path.exists():
+        return False
+    local_size = save_path.stat().st_size
+    if local_size == 0:
+        return False
+    try:
+        r = session.head(_file_url(file_id), timeout=TIMEOUT)
+        r.raise_for_status()
+        remote_size = int(r.headers["Content-Length"])
+    except Exception:
+        # HEAD 不支援或沒有 Content-Length 時，退回原本的「非空就算完整」判斷
+        return True
+    return local_size == remote_size
+
+
+def download_file(session: requests.Session, file_id: str, save_path: Path) -> None:
+    url = _file_url(file_id)
+
+    # 先寫到 .part，成功後再原子換名 —— save_path 一旦存在就保證是完整檔案
+    tmp = save_path.with_name(save_path.name + ".part")
+    existing = tmp.stat().st_size if tmp.exists() else 0
+    headers = {"Range": f"bytes={existing}-"} if existing else {}
+
+    try:
+        with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+            # 伺服器不支援 Range（回 200 而非 206）時整個重抓
+            if existing and r.status_code != 206:
+                existing = 0
+            r.raise_for_status()
+            # 直接從 urllib3 的 raw stream 拷到檔案，免去 iter_content 逐塊建 bytes 物件；
+            # buffering=0 讓 1 MiB 的大塊直接 write() 進 kernel，不再經過 Python 的緩衝層多拷一次
+            r.raw.decode_content = True
+            with open(tmp, "ab" if existing else "wb", buffering=0) as f:
+                shutil.copyfileobj(r.raw, f, length=1024 * 1024)
+        os.replace(tmp, save_path)
+    except Exception as e:
+        raise RuntimeError(f"下載失敗：{url} -> {save_path.name}，最後錯誤：{e}")
+
+
+def read_input_file(path: str, column: str) -> List[str]:
+    """只讀出指定欄位的非空值（我們只需要一欄，不用整份進 pandas）。"""
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"找不到輸入檔：{path}")
+
+    values: List[str] = []
+
+    if p.suffix.lower() == ".xlsx":
+        wb = load_workbook(p, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            rows = ws.iter_rows(values_only=True)
+            header = list(next(rows, None) or ())
+            if column not in header:
+                raise ValueError(f"輸入檔沒有欄位：{column}，目前欄位：{header}")
+            idx = header.index(column)
+            for row in rows:
+                v = row[idx] if idx < len(row) else None
+                if v is not None and str(v).strip():
+                    values.append(str(v).strip())
+        finally:
+            wb.close()
+    elif p.suffix.lower() == ".csv":
+        with open(p, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f"輸入檔沒有欄位：{column}，目前欄位：{reader.fieldnames}")
+            for row in reader:
+                v = row.get(column)
+                if v and v.strip():
+                    values.append(v.strip())
+    else:
+        raise ValueError("輸入檔只支援 .xlsx/.csv")
+
+    return values
+
+
+# 同一案件的多個檔案也平行抓（獨立於案件層的 pool，避免兩層任務互等）
+_download_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="download")
+
+
+def process_case(session: requests.Session, pubno: str) -> Dict[str, Any]:
+    """處理單一案件（查 caseNo -> 列檔案 -> 下載），回傳一筆 log row。"""
+    case_id = normalize_case_id(pubno)
+
+    try:
+        # normalize 後的 case_id 通常就是 caseNo，先直接賭 getResultFileList，省掉 getCaseInfo 一趟
+        case_no = case_id
+        try:
+            file_items = parse_file_items(get_file_list(session, case_id))
+        except Exception:
+            file_items = []
+
+        if not file_items:
+            # 賭錯了（或真的沒檔案）：照舊走 getCaseInfo 查正式的 caseNo
+            case_info = get_case_info(session, case_id)
+            case_no = case_info.get("caseNo") or case_info.get("caseNO")
+
+            if not case_no:
+                return {"公開公告號": pubno, "caseId": case_id, "status": "FAIL", "reason": "查不到 caseNo"}
+
+            if str(case_no) != case_id:
+                file_items = parse_file_items(get_file_list(session, str(case_no)))
+
+        if not file_items:
+            return {"公開公告號": pubno, "caseId": case_id, "caseNo": case_no, "status": "FAIL", "reason": "沒有可下載檔案"}
+
+        downloaded = 0
+        pending = []
+        for fname, fid in file_items:
+            if not keyword_filter(fname):
+                continue
+
+            out_name = safe_filename(f"{pubno}_{fname}")
+            save_path = SAVE_DIR / out_name
+
+            # 已存在且完整就略過（可重跑）
+            if is_already_downloaded(session, fid, save_path):
+                downloaded += 1
+                continue
+
+            pending.append(_download_pool.submit(download_file, session, fid, save_path))
+
+        for future in pending:
+            future.result()
+            downloaded += 1
+
+        return {"公開公告號": pubno, "caseId": case_id, "caseNo": case_no, "status": "OK", "downloaded_files": downloaded}
+
+    except Exception as e:
+        return {"公開公告號": pubno, "caseId": case_id, "status": "FAIL", "reason": str(e)}
+
+
+def main():
+    # 去掉重複的公開公告號（常見於合併過的清單），保留原本順序
+    pubnos = list(dict.fromkeys(read_input_file(INPUT_FILE, INPUT_COLUMN)))
+
+    # 所有請求都打同一台主機，共用連線池讓多執行緒重用 keep-alive 連線
+    session = make_session()
+    session.token_cache.ensure_fresh()  # 先驗一次帳密，有問題及早失敗
+
+    # log 逐筆寫入（完成順序），中途當掉也保得住已處理的紀錄
+    log_path = Path("download_log.csv")
+    try:
+        log_f = open(log_path, "w", newline="", encoding="utf-8-sig")
+    except PermissionError:
+        # 如果檔案被其它程式開啟（例如 Excel），則改寫入含時間戳的新檔名
+        import datetime
+        log_path = Path(f"download_log_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        log_f = open(log_path, "w", newline="", encoding="utf-8-sig")
+
+    try:
+        writer = csv.DictWriter(
+            log_f,
+            fieldnames=["公開公告號", "caseId", "caseNo", "status", "reason", "downloaded_files"],
+            restval="",
+        )
+        writer.writeheader()
+
+        # 下載是純網路 I/O，用 thread pool 同時跑多筆案件來重疊等待時間
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [executor.submit(process_case, session, pubno) for pubno in pubnos]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading"):
+                writer.writerow(future.result())
+                log_f.flush()
+    finally:
+        log_f.close()
+
+    print(f"完成！下載資料夾：pdf_downloads/，log：{log_path}")
+
+
+if __name__ == "__main__":
+    main()